@@ -0,0 +1,354 @@
+"""FastAPI sample app that ships ECS request logs straight to Elasticsearch.
+
+Run locally with `make test-fastapi` (uvicorn scripts.backend.fastapi_logging:app).
+Log records are handed off through a QueueHandler so request handling never
+waits on Elasticsearch I/O; a QueueListener thread owns the actual handlers.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+import ecs_logging
+import uvicorn
+from elasticsearch import Elasticsearch, helpers
+from fastapi import FastAPI, Request
+from starlette.background import BackgroundTask, BackgroundTasks
+
+ELASTICSEARCH_URL = os.getenv("ELASTICSEARCH_URL", "http://localhost:9200")
+ELASTICSEARCH_USER = os.getenv("ELASTICSEARCH_USER", "")
+ELASTICSEARCH_PASSWORD = os.getenv("ELASTICSEARCH_PASSWORD", "")
+LOG_INDEX = os.getenv("LOG_INDEX", "fastapi-logs")
+
+# Shared fallback for records without extras - avoids allocating an empty
+# dict per emitted record
+_EMPTY_EXTRA: dict = {}
+
+
+def build_elasticsearch_client() -> Elasticsearch:
+    """Build an Elasticsearch client from environment configuration"""
+    # Bounded timeout so a slow/unreachable ES can't stall log flushing,
+    # in particular the final flush during interpreter shutdown
+    kwargs = {"hosts": [ELASTICSEARCH_URL], "request_timeout": 5}
+    if ELASTICSEARCH_USER:
+        kwargs["basic_auth"] = (ELASTICSEARCH_USER, ELASTICSEARCH_PASSWORD)
+    return Elasticsearch(**kwargs)
+
+
+# The second-resolution prefix of "@timestamp" repeats across every record
+# in the same wall-clock second, so format it once per second and only
+# append the microseconds per record. Bounded to a handful of entries.
+_TS_PREFIX_CACHE: dict = {}
+
+
+def _format_timestamp(created: float) -> str:
+    """ISO-8601 UTC timestamp from a LogRecord's created float"""
+    sec = int(created)
+    prefix = _TS_PREFIX_CACHE.get(sec)
+    if prefix is None:
+        if len(_TS_PREFIX_CACHE) >= 4:
+            _TS_PREFIX_CACHE.clear()
+        prefix = datetime.fromtimestamp(sec, timezone.utc).strftime(
+            "%Y-%m-%dT%H:%M:%S"
+        )
+        _TS_PREFIX_CACHE[sec] = prefix
+    return f"{prefix}.{int((created - sec) * 1_000_000):06d}Z"
+
+
+class ElasticsearchHandler(logging.Handler):
+    """Indexes each log record into Elasticsearch as an ECS-ish document"""
+
+    def __init__(self, client: Elasticsearch, index: str):
+        super().__init__()
+        self.client = client
+        self.index = index
+
+    def _serialize_record(self, record: logging.LogRecord) -> dict:
+        document = {
+            # record.created already captured the wall clock at emit time;
+            # no need to read it again here
+            "@timestamp": _format_timestamp(record.created),
+            "log.level": record.levelname,
+            "log.logger": record.name,
+            "message": record.getMessage(),
+        }
+        document.update(getattr(record, "extra_fields", _EMPTY_EXTRA))
+        return document
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.client.index(index=self.index, document=self._serialize_record(record))
+        except Exception:
+            self.handleError(record)
+
+
+class BatchingElasticsearchHandler(ElasticsearchHandler):
+    """Buffers records on a queue and bulk-indexes them from a worker thread.
+
+    emit() only serializes and enqueues; a daemon thread pulls up to
+    `batch_size` documents (waiting at most `flush_interval` seconds for
+    the first one) and sends them through `helpers.bulk`, so there is one
+    HTTP request per batch instead of per record. When the queue is full
+    the record is dropped and counted rather than blocking the caller.
+    """
+
+    def __init__(
+        self,
+        client: Elasticsearch,
+        index: str,
+        batch_size: int = 500,
+        queue_size: int = 10000,
+        flush_interval: float = 1.0,
+    ):
+        super().__init__(client, index)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        # Not named _closed: logging.Handler.close() assigns that slot
+        self._stop = threading.Event()
+        self._worker = threading.Thread(
+            target=self._drain, name="es-bulk-drain", daemon=True
+        )
+        self._worker.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            document = self._serialize_record(record)
+        except Exception:
+            self.handleError(record)
+            return
+        try:
+            self._queue.put_nowait(document)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> None:
+        while not self._stop.is_set():
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._bulk(batch)
+
+    def _bulk(self, batch: list) -> None:
+        try:
+            helpers.bulk(
+                self.client,
+                ({"_index": self.index, "_source": doc} for doc in batch),
+            )
+        except Exception:
+            # Drop the batch rather than stall the worker thread on retries
+            pass
+
+    def flush(self) -> None:
+        batch: list = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._bulk(batch)
+
+    def close(self) -> None:
+        # Stop the worker first so the final flush doesn't race it for
+        # queued documents, then drain whatever is left synchronously
+        if not self._stop.is_set():
+            self._stop.set()
+            self._worker.join(timeout=2 * self.flush_interval)
+            self.flush()
+        super().close()
+
+
+# QueueListener that owns the stream + Elasticsearch handlers; log calls only
+# enqueue the record, so the asyncio event loop never blocks on ES round-trips.
+_listener: Optional[QueueListener] = None
+
+
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+        # Close the listener-owned handlers while the interpreter is still
+        # fully alive: this cancels pending flush timers, performs the final
+        # flush, and deregisters them from logging.shutdown()
+        for handler in listener.handlers:
+            handler.close()
+
+
+def configure_logging() -> logging.Logger:
+    """Configure the root logger with queue-offloaded stream + ES handlers"""
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+
+    if any(isinstance(h, QueueHandler) for h in root.handlers):
+        return root
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(ecs_logging.StdlibFormatter())
+    handlers: list = [stream]
+
+    # Only pay for DNS/TCP/TLS/auth when ES is actually configured; a
+    # broken ES setup degrades to stdout-only logging instead of
+    # crashing the app at boot
+    if os.getenv("ELASTICSEARCH_URL"):
+        try:
+            handlers.append(
+                BatchingElasticsearchHandler(build_elasticsearch_client(), LOG_INDEX)
+            )
+        except Exception as e:
+            logging.getLogger(__name__).warning(
+                f"Elasticsearch logging disabled: {e}"
+            )
+
+    log_queue: queue.Queue = queue.Queue(maxsize=10000)
+    root.addHandler(QueueHandler(log_queue))
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listener)
+    return root
+
+
+class ExtraAdapter(logging.LoggerAdapter):
+    """Lets call sites pass fields={...} instead of nesting extra dicts.
+
+    The dict is attached by reference as record.extra_fields, so each log
+    call allocates one dict instead of the inner-plus-outer pair that
+    extra={"extra_fields": {...}} required.
+    """
+
+    def process(self, msg, kwargs):
+        kwargs.setdefault("extra", {})["extra_fields"] = kwargs.pop(
+            "fields", _EMPTY_EXTRA
+        )
+        return msg, kwargs
+
+
+logger = ExtraAdapter(configure_logging(), {})
+
+# Invariant extra fields shared by every record this app emits
+_STATIC_EXTRA = {"demo": "fastapi"}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info(
+        "FastAPI logging service starting up",
+        fields={"event": "startup", "demo": "fastapi"},
+    )
+    yield
+    logger.info(
+        "FastAPI logging service shutting down",
+        fields={"event": "shutdown", "demo": "fastapi"},
+    )
+    _stop_listener()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/api/echo")
+async def echo(request: Request, message: Optional[str] = "hello"):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            f"Echoing message: {message}",
+            fields={
+                **_STATIC_EXTRA,
+                "endpoint": "/api/echo",
+                "correlation_id": getattr(request.state, "correlation_id", "unknown"),
+                "message_length": len(message) if message else 0,
+            },
+        )
+    return {"echo": message}
+
+
+def _log_request(
+    method: str,
+    path: str,
+    status_code: int,
+    duration_ms: float,
+    client_ip: str,
+    correlation_id: str,
+) -> None:
+    logger.info(
+        f"{method} {path} -> {status_code}",
+        fields={
+            **_STATIC_EXTRA,
+            "http.method": method,
+            "http.path": path,
+            "http.status_code": status_code,
+            "event.duration_ms": duration_ms,
+            "client.ip": client_ip,
+            "correlation_id": correlation_id,
+        },
+    )
+
+
+@app.middleware("http")
+async def request_logger(request: Request, call_next):
+    """Logs every request with method, path, status and duration"""
+    correlation_id = str(uuid.uuid4())
+    request.state.correlation_id = correlation_id
+    start_time = time.time()
+
+    response = await call_next(request)
+
+    # Skip the extras allocation entirely when INFO is filtered out
+    if not logger.isEnabledFor(logging.INFO):
+        return response
+
+    duration_ms = (time.time() - start_time) * 1000
+    # Build the log record after the response is flushed to the client,
+    # chaining any background task the endpoint already attached
+    task = BackgroundTask(
+        _log_request,
+        request.method,
+        request.url.path,
+        response.status_code,
+        duration_ms,
+        request.client.host if request.client else "unknown",
+        correlation_id,
+    )
+    if response.background is not None:
+        task = BackgroundTasks([response.background, task])
+    response.background = task
+    return response
+
+
+if __name__ == "__main__":
+    # uvloop + httptools (bundled with uvicorn[standard]) instead of the
+    # default selector loop; uvicorn's own access log is disabled since
+    # request_logger already emits a structured record per request.
+    # Use --reload via the CLI for development - it forks a watcher and
+    # reruns module init (including the ES client build) on every touch.
+    uvicorn.run(
+        "scripts.backend.fastapi_logging:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        loop="uvloop",
+        http="httptools",
+        access_log=False,
+        log_config=None,
+    )
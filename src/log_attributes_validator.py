@@ -7,6 +7,7 @@ Log Attributes Validator & Enricher
 
 import logging
 import os
+import re
 from enum import Enum
 from typing import Any, Dict, Tuple
 
@@ -56,6 +57,49 @@ class EventCategory(str, Enum):
     INFRASTRUCTURE = "infrastructure"
 
 
+# 在 import 時預先計算驗證集合：frozenset 查找 O(1)，且熱路徑不再每次
+# 重建 [e.value for e in ...] 列表
+_LOG_LEVEL_VALUES = frozenset(e.value for e in LogLevel)
+_EVENT_DOMAIN_VALUES = frozenset(e.value for e in EventDomain)
+_EVENT_TYPE_VALUES = frozenset(e.value for e in EventType)
+_VALID_ENVIRONMENTS = frozenset(("prod", "staging", "dev", "test"))
+_MANDATORY = (
+    "service.name",
+    "deployment.environment",
+    "log.level",
+    "event.domain",
+    "event.type",
+)
+
+# PII 遮蔽用的正規表達式：import 時編譯一次，strip_pii 不再每次重新編譯
+_CC_RE = re.compile(r"\b(?:\d{4}[-\s]?){3}\d{4}\b")
+_EMAIL_RE = re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b")
+_PHONE_RE = re.compile(r"\b09\d{8}\b")
+
+# service.name -> namespace 對照表：完全符合走 O(1) 查表；帶後綴的名稱
+# （如 auth-session-api）用單一交替式正規表達式一次掃描，取代逐一 substring
+_NAMESPACE_MAP = {
+    "auth-session": "identity",
+    "dictation_frontend": "frontend",
+    "dictation_backend": "backend",
+    "worklist": "frontend",
+    "viewer": "frontend",
+}
+_NAMESPACE_RE = re.compile(
+    "|".join(map(re.escape, sorted(_NAMESPACE_MAP, key=len, reverse=True)))
+)
+
+# enricher 會補充的全部欄位：若輸入已齊備，enrich 可以直接回傳原 dict
+_ENRICHED_KEYS = (
+    "service.name",
+    "deployment.environment",
+    "service.version",
+    "host.name",
+    "service.namespace",
+    "event.category",
+)
+
+
 class LogAttributesValidator:
     """強制日誌屬性契約"""
 
@@ -89,74 +133,74 @@ class LogAttributesValidator:
         """
         驗證並淨化日誌屬性
 
+        注意：不複製輸入，cleaned_attributes 就是傳入的 dict 本身；
+        呼叫端若要保留原始內容請自行複製（enricher 在需要時已複製過）
+
         Returns:
             (is_valid, error_message, cleaned_attributes)
         """
-        cleaned = attributes.copy() if attributes else {}
+        cleaned = attributes if attributes else {}
 
         # 1. 檢查必須欄位
-        for attr in LogAttributesValidator.MANDATORY_ATTRIBUTES:
+        for attr in _MANDATORY:
             if attr not in cleaned or not cleaned[attr]:
                 return False, f"Missing mandatory attribute: {attr}", cleaned
 
         # 2. 驗證 log.level
-        try:
-            log_level = cleaned.get("log.level")
-            if log_level not in [e.value for e in LogLevel]:
-                return False, f"Invalid log.level: {log_level}", cleaned
-        except Exception as e:
-            return False, f"Failed to validate log.level: {str(e)}", cleaned
+        log_level = cleaned.get("log.level")
+        if log_level not in _LOG_LEVEL_VALUES:
+            return False, f"Invalid log.level: {log_level}", cleaned
 
         # 3. 驗證 deployment.environment
         env = cleaned.get("deployment.environment")
-        if env not in LogAttributesValidator.VALID_ENVIRONMENTS:
+        if env not in _VALID_ENVIRONMENTS:
             return False, f"Invalid deployment.environment: {env}", cleaned
 
         # 4. 驗證 event.domain
-        try:
-            event_domain = cleaned.get("event.domain")
-            if event_domain not in [e.value for e in EventDomain]:
-                return False, f"Invalid event.domain: {event_domain}", cleaned
-        except Exception as e:
-            return False, f"Failed to validate event.domain: {str(e)}", cleaned
+        event_domain = cleaned.get("event.domain")
+        if event_domain not in _EVENT_DOMAIN_VALUES:
+            return False, f"Invalid event.domain: {event_domain}", cleaned
 
         # 5. 驗證 event.type
-        try:
-            event_type = cleaned.get("event.type")
-            if event_type not in [e.value for e in EventType]:
-                return False, f"Invalid event.type: {event_type}", cleaned
-        except Exception as e:
-            return False, f"Failed to validate event.type: {str(e)}", cleaned
-
-        # 6. 檢查禁止關鍵字（在整個 attributes 值中）
-        attributes_str = str(cleaned).lower()
-        for keyword in LogAttributesValidator.FORBIDDEN_KEYWORDS:
-            if keyword.lower() in attributes_str:
-                return False, f"Forbidden keyword detected: {keyword}", cleaned
+        event_type = cleaned.get("event.type")
+        if event_type not in _EVENT_TYPE_VALUES:
+            return False, f"Invalid event.type: {event_type}", cleaned
+
+        # 6. 檢查禁止關鍵字（只掃描字串值：一次正規表達式掃描取代
+        # 整個 dict 的 repr 加上 7 次子字串搜尋；非字串值不會內嵌敏感字）
+        for value in cleaned.values():
+            if isinstance(value, str):
+                match = _FORBIDDEN_RE.search(value.lower())
+                if match:
+                    return (
+                        False,
+                        f"Forbidden keyword detected: {match.group()}",
+                        cleaned,
+                    )
 
         return True, "", cleaned
 
     @staticmethod
     def strip_pii(text: str) -> str:
         """移除或遮蔽潛在的 PII 資料"""
-        import re
-
         # 簡單的信用卡號遮蔽
-        text = re.sub(r"\b(?:\d{4}[-\s]?){3}\d{4}\b", "[REDACTED_CARD]", text)
+        text = _CC_RE.sub("[REDACTED_CARD]", text)
 
         # 簡單的 email 遮蔽
-        text = re.sub(
-            r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b",
-            "[REDACTED_EMAIL]",
-            text,
-        )
+        text = _EMAIL_RE.sub("[REDACTED_EMAIL]", text)
 
         # 簡單的電話號碼遮蔽（台灣格式）
-        text = re.sub(r"\b09\d{8}\b", "[REDACTED_PHONE]", text)
+        text = _PHONE_RE.sub("[REDACTED_PHONE]", text)
 
         return text
 
 
+# 單一交替式正規表達式：對每個字串值只掃描一次，而不是每個關鍵字各掃一次
+_FORBIDDEN_RE = re.compile(
+    "|".join(map(re.escape, LogAttributesValidator.FORBIDDEN_KEYWORDS))
+)
+
+
 class LogAttributesEnricher:
     """自動補充日誌屬性"""
 
@@ -164,7 +208,12 @@ class LogAttributesEnricher:
     def enrich_from_service_context(attributes: Dict[str, Any]) -> Dict[str, Any]:
         """
         從環境和上下文補充屬性
+
+        輸入已含全部補充欄位時直接回傳原 dict（不複製）；只有真的需要
+        寫入時才複製一次
         """
+        if attributes and all(k in attributes for k in _ENRICHED_KEYS):
+            return attributes
         enriched = attributes.copy() if attributes else {}
 
         # 補充服務名稱（若未提供）
@@ -200,19 +249,12 @@ class LogAttributesEnricher:
     @staticmethod
     def _infer_namespace(service_name: str) -> str:
         """根據 service.name 推斷 namespace"""
-        mapping = {
-            "auth-session": "identity",
-            "dictation_frontend": "frontend",
-            "dictation_backend": "backend",
-            "worklist": "frontend",
-            "viewer": "frontend",
-        }
-
-        for key, value in mapping.items():
-            if key in service_name.lower():
-                return value
-
-        return "unknown"
+        name = service_name.lower()
+        namespace = _NAMESPACE_MAP.get(name)
+        if namespace is not None:
+            return namespace
+        match = _NAMESPACE_RE.search(name)
+        return _NAMESPACE_MAP[match.group()] if match else "unknown"
 
     @staticmethod
     def _infer_category(event_domain: str) -> str:
@@ -227,6 +269,15 @@ class LogAttributesEnricher:
         return mapping.get(event_domain, "frontend")
 
 
+# 已通過驗證的屬性「形狀」快取：大多數請求共用同一組 header。鍵涵蓋
+# validate_attributes 中所有形狀可決定的部分——鍵集合、必須欄位是否
+# 皆非空、四個受驗證的枚舉值——命中時只省略這些檢查；依賴實際值的
+# 禁止關鍵字掃描不在其中，呼叫端每次照常執行。
+# 上限 1024 筆，滿了整批清掉（形狀種類極少，重新暖機成本可忽略）
+_SHAPE_CACHE: set = set()
+_SHAPE_CACHE_MAX = 1024
+
+
 def validate_and_enrich_log_record(
     log_body: str, attributes: Dict[str, Any]
 ) -> Tuple[bool, Dict[str, Any], str]:
@@ -239,24 +290,47 @@ def validate_and_enrich_log_record(
     # 1. 補充缺失的屬性
     enriched = LogAttributesEnricher.enrich_from_service_context(attributes)
 
-    # 2. 驗證必須欄位和值
-    is_valid, error_msg, cleaned = LogAttributesValidator.validate_attributes(enriched)
+    # 2a. 禁止關鍵字依賴每個請求的實際值（如 header 帶入的
+    # service.name），不能由形狀快取代答，無論快取與否都要掃描
+    for value in enriched.values():
+        if isinstance(value, str):
+            match = _FORBIDDEN_RE.search(value.lower())
+            if match:
+                error_msg = f"Forbidden keyword detected: {match.group()}"
+                logger.warning("Log validation failed: %s", error_msg)
+                return False, enriched, error_msg
+
+    # 2b. 驗證必須欄位和枚舉值；同形狀已驗證過就跳過
+    shape_key = (
+        frozenset(enriched),
+        all(enriched.get(attr) for attr in _MANDATORY),
+        enriched.get("deployment.environment"),
+        enriched.get("log.level"),
+        enriched.get("event.domain"),
+        enriched.get("event.type"),
+    )
+    if shape_key not in _SHAPE_CACHE:
+        is_valid, error_msg, cleaned = LogAttributesValidator.validate_attributes(
+            enriched
+        )
+
+        if not is_valid:
+            logger.warning("Log validation failed: %s", error_msg)
+            return False, cleaned, error_msg
 
-    if not is_valid:
-        logger.warning(f"Log validation failed: {error_msg}")
-        return False, cleaned, error_msg
+        if len(_SHAPE_CACHE) >= _SHAPE_CACHE_MAX:
+            _SHAPE_CACHE.clear()
+        _SHAPE_CACHE.add(shape_key)
 
     # 3. 在 log body 中檢查禁止關鍵字
-    if any(
-        keyword.lower() in log_body.lower()
-        for keyword in LogAttributesValidator.FORBIDDEN_KEYWORDS
-    ):
+    if _FORBIDDEN_RE.search(log_body.lower()):
         logger.warning("Log body contains forbidden keywords")
         # 注意：不拒絕，但要遮蔽
         sanitized_body = LogAttributesValidator.strip_pii(log_body)
-        logger.warning(f"Log body sanitized: {sanitized_body}")
+        logger.warning("Log body sanitized: %s", sanitized_body)
 
-    return True, cleaned, ""
+    # validate_attributes 不複製輸入，成功時 cleaned 即 enriched 本身
+    return True, enriched, ""
 
 
 if __name__ == "__main__":